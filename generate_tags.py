@@ -11,6 +11,8 @@ from functools import partial
 from utils.config_helper import TAGS, N_PROCESSES, TAGGING_API
 from utils.constants import KEY, TAG_URL, UPLOAD_URLS, GENERATE_TAGS_LOG, N_RETRIES
 from utils.logging_helpers import get_logger
+from utils.compression_helpers import check_compression, get_extension, open_file
+from utils.profiling_helpers import Profiler
 from pathlib import Path
 
 
@@ -168,12 +170,13 @@ class Tagger:
         tags = json_data["tags"]
         return tags
 
-    def __processFile(self, destination_path, tag_selection, api_key, file_name):
+    def __processFile(self, destination_path, tag_selection, api_key, compression, file_name):
         """
          Uploads the given audio track, tags it, and saves the tags in a json file located in the destination path
          :param destination_path: string - The path where tag json files are saved
          :param tag_selection: list - A list containing the type of tags to tag the track for
          :param api_key: str - Your API key provided by Musiio
+         :param compression: string - None, "gzip" or "zstd" to compress the json file
          :param file_name: string - The path where the audio track is stored
          :return: 1 if successful, 0 if unsuccessful
          """
@@ -210,23 +213,24 @@ class Tagger:
                 # If URL, store everything
                 out_content["file_name"] = file_name
             out_content["feature_id"] = feature_id
-            out_file = feature_id + ".json"
+            out_file = feature_id + ".json" + get_extension(compression)
             out_path = os.path.join(destination_path, out_file)
 
-            with codecs.open(out_path, "w", "utf-8") as file:
+            with open_file(out_path, "w", compression) as file:
                 file.write(json.dumps(out_content))
 
             return 1
 
         return 0
 
-    def __tagFiles(self, file_list, destination_path, tag_selection, api_key=None):
+    def __tagFiles(self, file_list, destination_path, tag_selection, api_key=None, compression=None):
         """
          Creates a ThreadPool to tag the given list of audio tracks
          :param file_list: list - A list containing the paths to each audio track
          :param destination_path: string - The path where tag json files are saved
          :param tag_selection: list - A list containing the type of tags to tag the track for
          :param api_key: str - Your API key provided by Musiio
+         :param compression: string - None, "gzip" or "zstd" to compress the json files
          """
 
         # Set the number of processes to use (5 set in config.json by default)
@@ -239,21 +243,26 @@ class Tagger:
             n_processes = len(file_list)
         # Create a ThreadPool to tag the files
         with ThreadPool(n_processes) as pool:
-            # Create a partial function to pass the destination path, tag selection, and api key to the processFile function
-            process = partial(self.__processFile, destination_path, tag_selection, api_key)
+            # Create a partial function to pass the destination path, tag selection, api key and compression to the processFile function
+            process = partial(self.__processFile, destination_path, tag_selection, api_key, compression)
             # apply the process function to each file in the file list
             # _ is a discarded variable that is not used
             _ = pool.map(process, file_list)
 
-    def tagFilesTask(self, source_path, destination_path, tag_selection=None, api_key=None):
+    def tagFilesTask(self, source_path, destination_path, tag_selection=None, api_key=None, compression=None):
         """
         Tag tracks in source folder and save the tags in the destination folder
         :param source_path: string - The path where tracks are stored
         :param destination_path: string - The path where tag json files are saved
         :param tag_selection: list - A list containing the type of tags to tag the track for
         :param api_key: str - Your API key provided by Musiio
+        :param compression: string - None, "gzip" or "zstd" to compress the json files
         """
 
+        compression = check_compression(compression)
+        if type(compression) == ValueError:
+            return ValueError(compression)
+
         # Convert paths str to Path for multiple OS compatibility
         source_path = Path(source_path)
         destination_path = Path(destination_path)
@@ -282,7 +291,7 @@ class Tagger:
             return ValueError(tag_selection)
 
         # call the tagFiles function to tag the files
-        self.__tagFiles(files, destination_path, tag_selection, api_key)
+        self.__tagFiles(files, destination_path, tag_selection, api_key, compression)
 
 
 
@@ -303,11 +312,28 @@ if __name__ == '__main__':
     parser.add_argument('--tag-selection', nargs='+', dest='tag_selection', default=TAGS,
                         help='The type of tags to tag each audio file for.')
 
+    parser.add_argument('--compression', dest='compression', choices=['gzip', 'zstd'],
+                        help='Compress the json tag files with gzip or zstd.')
+
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                        help='Profile the run and write the report in the destination path.')
+
+    parser.add_argument('--profile-deterministic', dest='profile_deterministic', action='store_true',
+                        help='With --profile, also run cProfile and write .pstats files. Slows down the run.')
+
     # Parse the command-line arguments
     args = parser.parse_args()
 
+    # Create the profiler - it does nothing unless --profile is specified
+    profiler = Profiler(args.destination_path, enabled=args.profile, deterministic=args.profile_deterministic)
+
     # Create an instance of the Tagger class
     tagger = Tagger()
 
     # Call the tagFilesTask method with the provided arguments
-    tagger.tagFilesTask(source_path=args.source_path, destination_path=args.destination_path, tag_selection=args.tag_selection)
+    with profiler.stage("tag_files"):
+        tagger.tagFilesTask(source_path=args.source_path, destination_path=args.destination_path, tag_selection=args.tag_selection,
+                            compression=args.compression)
+
+    profiler.writeReport()
+
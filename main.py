@@ -7,6 +7,7 @@ from utils.constants import GENERATE_TAGS_LOG
 from generate_tags import Tagger
 from utils.config_helper import TAGS
 from utils.logging_helpers import get_logger
+from utils.profiling_helpers import Profiler
 from tags_to_csv import sortTags
 import platform
 import time
@@ -31,6 +32,15 @@ if __name__ == '__main__':
     parser.add_argument('--csv-destination-path', dest='csv_destination_path', default='csv',
                         help='The path to where the csv file will be written.')
 
+    parser.add_argument('--compression', dest='compression', choices=['gzip', 'zstd'],
+                        help='Compress the json tag files and the csv file with gzip or zstd.')
+
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                        help='Profile each stage of the run and write the report next to the csv file.')
+
+    parser.add_argument('--profile-deterministic', dest='profile_deterministic', action='store_true',
+                        help='With --profile, also run cProfile and write .pstats files. Slows down the run.')
+
     # Parse the command line arguments
     args = parser.parse_args()
 
@@ -58,14 +68,23 @@ if __name__ == '__main__':
     else:
         json_destination_path = args.json_destination_path
 
+    # Create the profiler - it does nothing unless --profile is specified
+    profiler = Profiler(args.csv_destination_path, enabled=args.profile, deterministic=args.profile_deterministic)
+
     # Create an instance of the Tagger class
     tagger = Tagger()
 
     # Tag the files and generate individual json tag files
-    tagger.tagFilesTask(source_path=source_path, destination_path=json_destination_path, tag_selection=TAGS)
+    with profiler.stage("tag_files"):
+        tagger.tagFilesTask(source_path=source_path, destination_path=json_destination_path, tag_selection=TAGS,
+                            compression=args.compression)
 
     # Sort the tags and generate the csv file
-    sortTags(tags_path=json_destination_path, tags_csv=args.csv_destination_path, tags_types=TAGS)
+    with profiler.stage("sort_tags"):
+        sortTags(tags_path=json_destination_path, tags_csv=args.csv_destination_path, tags_types=TAGS,
+                 compression=args.compression)
+
+    profiler.writeReport()
 
     # If no --json-destination-path is specified, delete the temporary folder
     if args.json_destination_path is None:
@@ -2,14 +2,20 @@ import os
 import csv
 import json
 import argparse
+import hashlib
+import tempfile
 
 from utils.config_helper import TAGS
-from utils.constants import VALID_TAGS, TagTypes, TagContent
+from utils.constants import VALID_TAGS, TagTypes, TagContent, EXPORT_SCHEMA_VERSION, EXPORT_SCHEMA_FILE, \
+    COMPRESSION_EXTENSIONS
+from utils.profiling_helpers import Profiler
+from utils.compression_helpers import check_compression, get_compression, get_extension, open_file
 
 
 def getTagsInFolder(tags_path):
     """
-    Check the provided folder for json files and return it in a list
+    Check the provided folder for json files (optionally gzip or zstd compressed) and return it in a list.
+    If a track has both an uncompressed and a compressed json file, only the uncompressed one is returned.
     :param tags_path: string - The path where tag jsons are stored
     :return: tags: list - A list containing the paths to each tag json
     """
@@ -19,11 +25,19 @@ def getTagsInFolder(tags_path):
         print(e)
         return ValueError(e)
 
-    tags = list()
+    # Uncompressed json file name -> file to export, preferring no compression, then gzip, then zstd
+    tags = dict()
+    preference = list(COMPRESSION_EXTENSIONS)
 
     for file in os.listdir(tags_path):
-        if file[-5:] == ".json":
-            tags.append(file)
+        compression = get_compression(file)
+        name = file[:len(file) - len(get_extension(compression))]
+        # Skip the export schema cache, which may be in the same folder when --tags-csv is --tags-path
+        if name[-5:] == ".json" and name != EXPORT_SCHEMA_FILE:
+            if name not in tags or preference.index(compression) < preference.index(get_compression(tags[name])):
+                tags[name] = file
+
+    tags = list(tags.values())
 
     if len(tags) == 0:
         e = 'ERROR: No tags found in the provided folder'
@@ -54,58 +68,151 @@ def checkValidTags(tags_types):
 
     return tags_types
 
-def writeTags(csv_writer, tags_path, file, keys):
+def getSchemaTagTypes(tags_types):
+    """
+    Get the requested tag types in the TagTypes definition order, so columns never depend on the order of the user's list
+    :param tags_types: list - The valid tag types to extract from each tag json file
+    :return: tag_list: list - The TagTypes objects of the export
+    """
+
+    return [tag for tag in TagTypes if tag.value in tags_types]
+
+
+def getContentHash(tag_list):
+    """
+    Hash the TagContent entries of the given tag types, so a cached schema is not reused after they change
+    :param tag_list: list - The TagTypes objects of the export
+    :return: content_hash: string - sha1 of the tag headers and counts
+    """
+
+    content = [[tag.value, TagContent.getKeyList(tag)] for tag in tag_list]
+    return hashlib.sha1(json.dumps(content).encode("utf-8")).hexdigest()
+
+
+def compileSchema(tags_types):
+    """
+    Compile the export schema for the given tag types: a fixed column order and, for every tag key,
+    the index of the name column of each slot the key fills (its score is in the next column)
+    :param tags_types: list - The valid tag types to extract from each tag json file
+    :return: schema: dict - The version, tag types, content hash, headers and slot indices of the export
+    """
+
+    tag_list = getSchemaTagTypes(tags_types)
+
+    headers = ["URL_FILENAME", "MUSIIO TMP ID"]
+    slots = dict()
+
+    for tag in tag_list:
+        content = TagContent.getKeyList(tag)
+        for key, count in content:
+            for _ in range(count):
+                slots.setdefault(key, list()).append(len(headers))
+                headers.append(key)
+                headers.append("SCORE")
+
+    return {"version": EXPORT_SCHEMA_VERSION,
+            "tag_types": [tag.value for tag in tag_list],
+            "content_hash": getContentHash(tag_list),
+            "headers": headers,
+            "slots": slots}
+
+
+def loadSchema(tags_csv, tags_types):
+    """
+    Load the export schema cached in the csv folder, or compile and cache it if there is none.
+    Every export written to the same csv folder must use the cached schema, so their rows can be merged.
+    :param tags_csv: string - The path where csv file and schema are saved
+    :param tags_types: list - The valid tag types to extract from each tag json file
+    :return: schema: dict - The version, tag types, content hash, headers and slot indices of the export
+    """
+
+    schema_path = os.path.join(tags_csv, EXPORT_SCHEMA_FILE)
+    tag_list = getSchemaTagTypes(tags_types)
+    tag_values = [tag.value for tag in tag_list]
+
+    if os.path.isfile(schema_path):
+        try:
+            with open(schema_path, 'r') as t:
+                schema = json.load(t)
+        except (OSError, ValueError):
+            # A corrupt schema cannot be checked against: it is compiled and cached again below
+            schema = None
+
+        if isinstance(schema, dict):
+            if schema.get("version") != EXPORT_SCHEMA_VERSION:
+                reason = "version {} instead of {}".format(schema.get("version"), EXPORT_SCHEMA_VERSION)
+            elif schema.get("tag_types") != tag_values:
+                reason = "tags {} instead of {}".format(schema.get("tag_types"), tag_values)
+            elif schema.get("content_hash") != getContentHash(tag_list):
+                reason = "the TagContent headers of these tags have changed"
+            else:
+                return schema
+
+            e = 'ERROR: The export schema in {} does not match this export ({}). ' \
+                'Use another csv folder, or delete the schema to start a new export.'.format(schema_path, reason)
+            print(e)
+            return ValueError(e)
+
+    schema = compileSchema(tags_types)
+
+    # Write to a temporary file first so parallel exporters never read a half-written schema
+    with tempfile.NamedTemporaryFile('w', dir=tags_csv, prefix=EXPORT_SCHEMA_FILE + '.', suffix='.tmp',
+                                     delete=False) as t:
+        json.dump(schema, t, indent=2)
+    os.replace(t.name, schema_path)
+
+    return schema
+
+
+def writeTags(csv_writer, tags_path, file, schema):
     """
-    Opens a given json file, checks through the given tag types, and writes it to the CSV file
+    Opens a given (optionally compressed) json file, fills each tag in its schema slot, and writes it to the CSV file
 
     :param csv_writer: csv writer object
     :param tags_path: string - The path where tag json files are stored
     :param file: file - output csv file
-    :param keys: list - list of tag types to check
+    :param schema: dict - export schema returned by compileSchema/loadSchema
 
     :return: None
     """
 
     # Open the json file
-    with open(tags_path + '/' + file, 'r') as t:
-        values = list()
-
+    with open_file(tags_path + '/' + file, 'r', get_compression(file)) as t:
         # Load the content of the json file
         content = json.load(t)
-        values.append(content["feature_id"])
-        values.append(content["file_name"])
-        tags = content["tags"]
-
-        # Iterate through the given tag types
-        for key in keys:
-            tag_exists = False
 
-            # Iterate through the tags in the json file
-            for index, tag in enumerate(tags):
-                if tag["type"] == key:
-                    values.append(tag["name"])
-                    values.append(tag["score"])
-                    tag_exists = True
+    # Missing tags are left as empty values
+    values = [""] * len(schema["headers"])
+    values[0] = content["feature_id"]
+    values[1] = content["file_name"]
 
-                    # Remove the tag from the list to avoid duplicate entries
-                    tags.pop(index)
-                    break
+    # Number of slots already filled for each tag key
+    filled = dict()
+    slots = schema["slots"]
 
-            # If the tag type doesn't exist, append empty values
-            if not tag_exists:
-                values.append("")
-                values.append("")
+    # Fill the tags in the order they are returned, extra tags of a key are dropped
+    for tag in content["tags"]:
+        key = tag["type"]
+        if key not in slots:
+            continue
+        n_filled = filled.get(key, 0)
+        if n_filled < len(slots[key]):
+            index = slots[key][n_filled]
+            values[index] = tag["name"]
+            values[index + 1] = tag["score"]
+            filled[key] = n_filled + 1
 
-        # Write the values to the CSV file
-        csv_writer.writerow(values)
+    # Write the values to the CSV file
+    csv_writer.writerow(values)
 
 
-def sortTags(tags_path, tags_csv, tags_types):
+def sortTags(tags_path, tags_csv, tags_types, compression=None):
     """
     Generate a CSV file of all the tags located in the provided folder
     :param tags_path: string - The path where tag jsons are stored
     :param tags_csv: string - The path where csv file will be saved
     :param tags_types: string - The tag types to extract from each tag json file
+    :param compression: string - None, "gzip" or "zstd" to compress the csv file
     :param progress: tkinter Progressbar type object. Only used in GUI
     """
 
@@ -114,39 +221,40 @@ def sortTags(tags_path, tags_csv, tags_types):
     if type(tags_types) == ValueError:
         return ValueError(tags_types)
 
-    # Built the set of TagTypes objects from the use tags_types list
-    tag_list = set([TagTypes(tag) for tag in tags_types])
-
-    keys = list()
-    headers = ["URL_FILENAME", "MUSIIO TMP ID"]
-
-    for tag in tag_list:
-        content = TagContent.getKeyList(tag)
-        for key, count in content:
-            for _ in range(count):
-                keys.append(key)
-                headers.append(key)
-                headers.append("SCORE")
+    compression = check_compression(compression)
+    if type(compression) == ValueError:
+        return ValueError(compression)
 
     # get all valid tag json files from the path provided
     tags = getTagsInFolder(tags_path)
     if type(tags) == ValueError:
         return ValueError(tags)
 
+    # check the json files can be decompressed before the csv file is created
+    for compression_type in set(get_compression(file) for file in tags):
+        compression_type = check_compression(compression_type)
+        if type(compression_type) == ValueError:
+            return ValueError(compression_type)
+
     # Check if destination path is valid
     if not os.path.isdir(tags_csv):
         os.makedirs(tags_csv, exist_ok=True)
-    tags_csv = os.path.join(tags_csv, 'tags.csv')
 
-    with open(tags_csv, 'w', newline='') as csv_file:
+    # Load the precomputed column order and slot indices
+    schema = loadSchema(tags_csv, tags_types)
+    if type(schema) == ValueError:
+        return ValueError(schema)
+    tags_csv = os.path.join(tags_csv, 'tags.csv' + get_extension(compression))
+
+    with open_file(tags_csv, 'w', compression, newline='') as csv_file:
 
         # creates headers
         csv_writer = csv.writer(csv_file, delimiter=',')
-        csv_writer.writerow(headers)
+        csv_writer.writerow(schema["headers"])
 
-        # iterate through tags in the folder
-        for file in tags:
-            writeTags(csv_writer, tags_path, file, keys)
+        # iterate through tags in the folder, sorted so rows are written in a stable order
+        for file in sorted(tags):
+            writeTags(csv_writer, tags_path, file, schema)
 
 
 # This code block is the main entry point of the script.
@@ -155,6 +263,9 @@ def sortTags(tags_path, tags_csv, tags_types):
 # - --tags-path: The path to the folder containing tags
 # - --tags-csv: The path to where the CSV file will be written (default is 'csv')
 # - --tags-types: The type of tags to extract from each file (default is TAGS constant)
+# - --compression: Compress the CSV file with gzip or zstd (default is no compression)
+# - --profile: Profile the run and write the report next to the CSV file
+# - --profile-deterministic: Also run cProfile when profiling (slower)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Generate CSV File Containing Tags')
@@ -168,7 +279,23 @@ if __name__ == '__main__':
     parser.add_argument('--tags-types', nargs='+', dest='tags_types', default=TAGS,
                         help='The type of tags to extract from each file')
 
+    parser.add_argument('--compression', dest='compression', choices=['gzip', 'zstd'],
+                        help='Compress the csv file with gzip or zstd')
+
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                        help='Profile the run and write the report next to the csv file')
+
+    parser.add_argument('--profile-deterministic', dest='profile_deterministic', action='store_true',
+                        help='With --profile, also run cProfile and write .pstats files. Slows down the run')
+
     args = parser.parse_args()
 
+    # Create the profiler - it does nothing unless --profile is specified
+    profiler = Profiler(args.tags_csv, enabled=args.profile, deterministic=args.profile_deterministic)
+
     # Calls the sortTags function with the provided command line arguments
-    sortTags(tags_path=args.tags_path, tags_csv=args.tags_csv, tags_types=args.tags_types)
\ No newline at end of file
+    with profiler.stage("sort_tags"):
+        sortTags(tags_path=args.tags_path, tags_csv=args.tags_csv, tags_types=args.tags_types,
+                 compression=args.compression)
+
+    profiler.writeReport()
@@ -0,0 +1,79 @@
+# Import necessary modules
+from utils.constants import COMPRESSION_EXTENSIONS
+import codecs
+import gzip
+
+
+def check_compression(compression):
+    """
+    Check whether the requested compression is supported and its package is installed
+    :param compression: string - None, "gzip" or "zstd"
+    :return: compression: string - The compression, or a ValueError if it is not supported
+    """
+
+    if compression not in COMPRESSION_EXTENSIONS:
+        e = 'ERROR: "{}" is not a valid compression, use one of: gzip, zstd'.format(compression)
+        print(e)
+        return ValueError(e)
+
+    # zstd is optional: check it is installed before any file is tagged or written
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            e = 'ERROR: The "zstandard" package is required for zstd compression: pip install zstandard'
+            print(e)
+            return ValueError(e)
+
+    return compression
+
+
+def get_extension(compression):
+    """
+    Get the file extension added by the given compression
+    :param compression: string - None, "gzip" or "zstd"
+    :return: extension: string - "", ".gz" or ".zst"
+    """
+
+    return COMPRESSION_EXTENSIONS[compression]
+
+
+def get_compression(file_path):
+    """
+    Detect the compression of a file from its extension
+    :param file_path: string - The path of the file
+    :return: compression: string - None, "gzip" or "zstd"
+    """
+
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if extension and str(file_path).endswith(extension):
+            return compression
+
+    return None
+
+
+def open_file(file_path, mode, compression=None, newline=None):
+    """
+    Open a utf-8 text file, transparently (de)compressing it as a stream
+    :param file_path: string - The path of the file
+    :param mode: string - "r", "w" or "a"
+    :param compression: string - None, "gzip" or "zstd"
+    :param newline: string - Passed to the text stream, use '' for csv files
+    :return: file: A text file object
+    """
+
+    if compression == "gzip":
+        return gzip.open(file_path, mode + "t", encoding="utf-8", newline=newline)
+
+    if compression == "zstd":
+        # zstd is optional: only required when it is requested
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('The "zstandard" package is required for zstd compression: pip install zstandard')
+        return zstandard.open(file_path, mode + "t", encoding="utf-8", newline=newline)
+
+    if newline is not None:
+        return open(file_path, mode, encoding="utf-8", newline=newline)
+
+    return codecs.open(file_path, mode, "utf-8")
@@ -87,3 +87,14 @@ UPLOAD_URLS = {'audio_link': BASE_URL + "/api/v1/upload/audio-link",
 GENERATE_TAGS_LOG = "GenerateTagsLog"
 
 N_RETRIES = 5
+
+# Folder (inside the output path) where --profile reports are written, and the stack sampling interval in seconds
+PROFILE_FOLDER = "profile"
+PROFILE_SAMPLING_INTERVAL = 0.01
+
+# Version of the compiled csv export schema (bump when compileSchema changes how columns are laid out) and its cache file name
+EXPORT_SCHEMA_VERSION = 1
+EXPORT_SCHEMA_FILE = "tags_schema.json"
+
+# Supported compressions of the json tag files and csv export, and the extension each one adds
+COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
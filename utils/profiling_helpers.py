@@ -0,0 +1,196 @@
+# Import necessary modules
+from utils.constants import GENERATE_TAGS_LOG, PROFILE_FOLDER, PROFILE_SAMPLING_INTERVAL
+from utils.logging_helpers import get_logger
+from collections import Counter
+from contextlib import contextmanager
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+
+logger = get_logger(GENERATE_TAGS_LOG)
+
+
+class StackSampler:
+    # Periodically samples the stacks of every running thread (including ThreadPool workers,
+    # which cProfile does not see) and aggregates them in flame-graph collapsed-stack format
+    def __init__(self, interval=PROFILE_SAMPLING_INTERVAL):
+        self.__interval = interval
+        self.__stacks = Counter()
+        self.__cpu_time = 0  # CPU seconds used by the sampler thread itself
+        self.__stop_event = threading.Event()
+        self.__thread = None
+
+    @staticmethod
+    def __frameName(frame):
+        """
+        Build a readable name for a stack frame
+        :param frame: frame - A python stack frame
+        :return: name: string - "file.py:function"
+        """
+
+        code = frame.f_code
+        return "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+
+    def __sample(self):
+        """
+        Record the current stack of every thread except the sampler itself
+        """
+
+        sampler_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_id:
+                continue
+            stack = list()
+            while frame is not None:
+                stack.append(self.__frameName(frame))
+                frame = frame.f_back
+            # Collapsed stacks are written root first
+            self.__stacks[";".join(reversed(stack))] += 1
+
+    def __run(self):
+        cpu_start = time.thread_time()
+        while not self.__stop_event.wait(self.__interval):
+            self.__sample()
+        self.__cpu_time = time.thread_time() - cpu_start
+
+    def start(self):
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__run, name="StackSampler", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        self.__thread.join()
+
+    def sampleCount(self):
+        return sum(self.__stacks.values())
+
+    def cpuTime(self):
+        return self.__cpu_time
+
+    def writeCollapsed(self, out_path):
+        """
+        Write the sampled stacks in the collapsed format read by flamegraph.pl / speedscope
+        :param out_path: string - The path of the collapsed-stack file
+        """
+
+        with open(out_path, "w") as file:
+            for stack, count in self.__stacks.most_common():
+                file.write("{} {}\n".format(stack, count))
+
+
+class ThreadProfilers:
+    # cProfile only profiles the thread that enables it: while installed, every thread started
+    # (e.g. the ThreadPool workers of a stage) enables its own profiler, merged in the stage pstats
+    def __init__(self):
+        self.__profiles = list()
+        self.__mutex = threading.Lock()
+
+    def __hook(self, frame, event, arg):
+        """
+        Called on the first profiling event of a new thread: replace this hook with a cProfile profiler
+        """
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ only allows one active cProfile profiler
+            sys.setprofile(None)
+            return
+        with self.__mutex:
+            self.__profiles.append(profile)
+
+    def install(self):
+        threading.setprofile(self.__hook)
+
+    def uninstall(self):
+        threading.setprofile(None)
+
+    def addTo(self, stats):
+        """
+        Merge the thread profilers in the given stats
+        :param stats: pstats.Stats - The stats of the stage
+        """
+
+        with self.__mutex:
+            for profile in self.__profiles:
+                stats.add(profile)
+
+
+class Profiler:
+    # Profiles the stages of a run with a stack sampler for all threads and wall vs CPU time.
+    # cProfile (for the calling thread and the threads it starts) is only added when deterministic is set,
+    # as it slows down the profiled code.
+    # When disabled, stage() does nothing.
+    def __init__(self, output_path, enabled=False, deterministic=False):
+        self.__output_path = output_path
+        self.__enabled = enabled
+        self.__deterministic = deterministic
+        self.__timings = list()  # (stage, wall seconds, cpu seconds, samples)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile the code run inside the with block and write its collapsed stacks (and pstats if deterministic)
+        :param name: string - The name of the stage, used for the report file names
+        """
+
+        if not self.__enabled:
+            yield
+            return
+
+        profile = cProfile.Profile() if self.__deterministic else None
+        thread_profiles = ThreadProfilers() if self.__deterministic else None
+        sampler = StackSampler()
+        sampler.start()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profile is not None:
+            thread_profiles.install()
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                thread_profiles.uninstall()
+            wall = time.perf_counter() - wall_start
+            cpu_end = time.process_time()
+            sampler.stop()
+            # Process CPU time without the sampler's own CPU time
+            cpu = max(cpu_end - cpu_start - sampler.cpuTime(), 0)
+
+            profile_path = os.path.join(self.__output_path, PROFILE_FOLDER)
+            os.makedirs(profile_path, exist_ok=True)
+            if profile is not None:
+                stats = pstats.Stats(profile)
+                thread_profiles.addTo(stats)
+                stats.dump_stats(os.path.join(profile_path, name + ".pstats"))
+            sampler.writeCollapsed(os.path.join(profile_path, name + ".collapsed"))
+
+            self.__timings.append((name, wall, cpu, sampler.sampleCount()))
+            logger.info("PROFILE: {} took {:.3f}s wall, {:.3f}s CPU".format(name, wall, cpu))
+
+    def writeReport(self):
+        """
+        Write the wall vs CPU time summary of all profiled stages
+        """
+
+        if not self.__enabled or len(self.__timings) == 0:
+            return
+
+        profile_path = os.path.join(self.__output_path, PROFILE_FOLDER)
+        os.makedirs(profile_path, exist_ok=True)
+        report_path = os.path.join(profile_path, "summary.txt")
+
+        with open(report_path, "w") as file:
+            file.write("STAGE,WALL (S),PROCESS CPU EXCL. SAMPLER (S),CPU / WALL,SAMPLES\n")
+            for name, wall, cpu, samples in self.__timings:
+                ratio = cpu / wall if wall > 0 else 0
+                file.write("{},{:.3f},{:.3f},{:.2f},{}\n".format(name, wall, cpu, ratio, samples))
+
+        logger.info("PROFILE: report written to {}".format(profile_path))